@@ -62,6 +62,7 @@ ENTITY TABLES:
     CustomerID SERIAL PRIMARY KEY,
     FirstName TEXT NOT NULL,
     LastName TEXT NOT NULL,
+    FullName TEXT (generated as FirstName || ' ' || LastName, indexed),
     Address TEXT,
     City TEXT,
     CountryID INTEGER (FK to Country)
@@ -70,7 +71,7 @@ ENTITY TABLES:
 - Product (
     ProductID SERIAL PRIMARY KEY,
     ProductName TEXT NOT NULL UNIQUE,
-    ProductUnitPrice REAL NOT NULL,
+    ProductUnitPrice NUMERIC(10,2) NOT NULL,
     ProductCategoryID INTEGER (FK to ProductCategory)
   )
 
@@ -80,6 +81,9 @@ FACT TABLE:
     CustomerID INTEGER (FK to Customer),
     ProductID INTEGER (FK to Product),
     OrderDate DATE NOT NULL,
+    OrderYear SMALLINT (generated from OrderDate),
+    OrderQuarter SMALLINT (generated from OrderDate),
+    OrderMonth SMALLINT (generated from OrderDate),
     QuantityOrdered INTEGER NOT NULL
   )
 
@@ -87,11 +91,9 @@ IMPORTANT NOTES:
 - Use JOINs to get descriptive values from dimension tables
 - OrderDate is DATE type - use DATE functions for filtering and grouping
 - To calculate revenue: ProductUnitPrice * QuantityOrdered
-- To get quarters: EXTRACT(QUARTER FROM OrderDate)
-- To get year: EXTRACT(YEAR FROM OrderDate)
-- To get month: EXTRACT(MONTH FROM OrderDate)
+- To get quarters/years/months: use the generated OrderQuarter, OrderYear and OrderMonth columns
 - Always use proper JOINs for foreign key relationships
-- Full customer name: FirstName || ' ' || LastName
+- Full customer name: use the indexed FullName column
 
 POSTGRESQL GROUP BY RULES (CRITICAL):
 - When using aggregate functions (SUM, COUNT, AVG, etc.), ALL non-aggregated columns in SELECT must be in GROUP BY